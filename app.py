@@ -1,18 +1,18 @@
 import streamlit as st
-import pandas as pd
 import time
 import os
 os.environ["HF_TOKEN"] = st.secrets["HF_TOKEN"]
 from youtube_utils import extract_video_id, get_video_details, get_transcript
-from langchain_utils import process_with_langchain
+from langchain_utils import get_doc_vectors, process_with_langchain, search_transcript
+from token_utils import get_token_budget
 from content_generators import (
-    generate_summary,
-    extract_key_points,
-    extract_notable_quotes,
-    generate_flashcards,
-    generate_concept_map,
-    generate_practice_questions
+    run_task,
+    run_tasks,
+    summarize_chapters,
+    format_chapter_summaries
 )
+from chapters import get_chapters
+from fingerprint_utils import find_transcript_match, register_transcript, shares_timeline, VECTOR_REUSE_THRESHOLD
 
 st.set_page_config(page_title="YouTube Transcript Analyzer", page_icon="🎬", layout="wide")
 
@@ -49,6 +49,14 @@ llm_model = st.sidebar.selectbox(
     help="Model to use for content generation"
 )
 
+token_budget = st.sidebar.number_input(
+    "Transcript Token Budget",
+    min_value=1000,
+    value=get_token_budget(llm_model),
+    step=1000,
+    help="Maximum transcript tokens sent to the LLM. Filler words and repeated captions are removed first, then the most informative chunks are kept."
+)
+
 whisper_model_size = st.sidebar.selectbox(
     "Whisper Model Size (for fallback)",
     ["tiny", "base", "small", "medium", "large"],
@@ -56,6 +64,12 @@ whisper_model_size = st.sidebar.selectbox(
     help="Larger models are more accurate but slower and require more memory"
 )
 
+skip_silence = st.sidebar.checkbox(
+    "Skip silence before Whisper",
+    value=True,
+    help="Detect speech with a voice activity pass and only transcribe speech regions. Timestamps still refer to the original audio."
+)
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("""
 ### About
@@ -82,6 +96,7 @@ if youtube_url:
         new_video = False
         if st.session_state.current_video_id != video_id:
             st.session_state.current_video_id = video_id
+            st.session_state.time_index = None
             new_video = True
         
         # Show video details
@@ -97,7 +112,7 @@ if youtube_url:
         
         # Generate transcript if it's a new video
         if new_video:
-            transcript, transcript_segments, transcript_source = get_transcript(video_id, whisper_model_size)
+            transcript, transcript_segments, transcript_source = get_transcript(video_id, whisper_model_size, skip_silence)
             
             if transcript_source in ["youtube", "whisper"]:
                 # Show transcript source success message
@@ -113,20 +128,47 @@ if youtube_url:
                 st.markdown("### Transcript Preview")
                 st.text_area("Full Transcript", st.session_state.transcript_text, height=300, key="transcript_tab1")
                 
-                # Process with LangChain
-                with st.spinner("Processing with LangChain..."):
-                    docs, vectorstore = process_with_langchain(
-                        transcript, 
-                        transcript_segments,
-                        embed_model=embedding_model
-                    )
+                # Reuse the embeddings of a near-duplicate video processed with the same model,
+                # but only when its timeline lines up with this video's
+                match = find_transcript_match(transcript, exclude=video_id)
+                if (
+                    match
+                    and match[1] >= VECTOR_REUSE_THRESHOLD
+                    and match[2].get("embed_model") == embedding_model
+                    and match[2].get("vectorstore")
+                    and shares_timeline(transcript_segments, match[2])
+                ):
+                    matched_id, similarity, entry = match
+                    docs, vectorstore, time_index = entry["docs"], entry["vectorstore"], entry["time_index"]
+                    st.success(f"✅ Reused vector embeddings of near-duplicate video {matched_id} ({similarity:.0%} transcript match)")
+                else:
+                    # Process with LangChain
+                    with st.spinner("Processing with LangChain..."):
+                        docs, vectorstore, time_index = process_with_langchain(
+                            transcript, 
+                            transcript_segments,
+                            embed_model=embedding_model
+                        )
                     
                     if docs and vectorstore:
-                        st.session_state.docs = docs
-                        st.session_state.vectorstore = vectorstore
                         st.success("✅ Vector embeddings created successfully")
                     else:
                         st.error("Failed to create vector embeddings")
+                
+                if docs and vectorstore:
+                    st.session_state.docs = docs
+                    st.session_state.vectorstore = vectorstore
+                    st.session_state.time_index = time_index
+                    register_transcript(
+                        video_id,
+                        transcript,
+                        transcript_segments,
+                        docs=docs,
+                        vectorstore=vectorstore,
+                        time_index=time_index,
+                        embed_model=embedding_model,
+                        transcript_source=transcript_source
+                    )
 
             else:
                 st.error(transcript)
@@ -136,6 +178,25 @@ if youtube_url:
             st.session_state.transcript_segments = transcript_segments
             st.session_state.transcript_source = transcript_source
             
+        # Optional time window for segments, search and content generation
+        time_index = st.session_state.get("time_index")
+        time_window = None
+        if time_index:
+            video_end = int(time_index.end_time) + 1
+            window_start, window_end = st.slider(
+                "Time Window (seconds)",
+                min_value=0,
+                max_value=video_end,
+                value=(0, video_end),
+                help="Restrict segments, search and generated content to part of the video"
+            )
+            if (window_start, window_end) != (0, video_end):
+                time_window = (window_start, window_end)
+                st.caption(
+                    f"Showing {time.strftime('%H:%M:%S', time.gmtime(window_start))}"
+                    f" – {time.strftime('%H:%M:%S', time.gmtime(window_end))}"
+                )
+        
         # Show transcript tabs
         tab1, tab2, tab3 = st.tabs(["Full Transcript", "Segments", "Content Analysis"])
         
@@ -152,96 +213,176 @@ if youtube_url:
                     
         with tab2:
             if "transcript_segments" in st.session_state and st.session_state.transcript_segments:
-                df = pd.DataFrame(st.session_state.transcript_segments)
-                # Format time
-                df['start_time'] = df['start'].apply(lambda x: time.strftime('%H:%M:%S', time.gmtime(x)))
-                
-                if "transcript_source" in st.session_state and st.session_state.transcript_source == "youtube":
-                    df = df[['start_time', 'text']]
-                    df.columns = ['Timestamp', 'Text']
-                else:  # whisper
-                    df = df[['start_time', 'text']]
-                    df.columns = ['Timestamp', 'Text']
-                
-                st.dataframe(df, use_container_width=True)
+                transcript_segments = st.session_state.transcript_segments
+                if time_window:
+                    transcript_segments = transcript_segments.slice_time(*time_window)
+                # Timestamps and CSV are computed once per transcript and cached on the segments
+                st.dataframe(transcript_segments.to_table(), use_container_width=True)
                 
                 # CSV download
-                csv = df.to_csv(index=False).encode('utf-8')
+                csv = transcript_segments.csv_bytes
                 st.download_button(
                     label="Download Segments as CSV",
                     data=csv,
                     file_name=f"youtube_transcript_segments_{video_id}.csv",
                     mime="text/csv",
                 )
+                
+                # Semantic search, with each hit expanded to its surrounding context
+                if "vectorstore" in st.session_state:
+                    query = st.text_input("Search Transcript", placeholder="What was said about...")
+                    if query:
+                        for doc in search_transcript(
+                            st.session_state.vectorstore, query, k=5, time_range=time_window, time_index=time_index
+                        ):
+                            timestamp = time.strftime('%H:%M:%S', time.gmtime(doc.metadata.get("start", 0)))
+                            with st.expander(f"{timestamp} — {doc.page_content}"):
+                                context = time_index.surrounding(doc) if time_index else [doc]
+                                st.write(" ".join(context_doc.page_content for context_doc in context))
             else:
                 st.info("No segments available for this transcript.")
         
         with tab3:
             # Content generation buttons
             if "docs" in st.session_state and os.environ.get("OPENAI_API_KEY"):
+                # Restrict generation to the selected time window
+                analysis_docs = time_index.between(*time_window) if time_window else st.session_state.docs
+                if not analysis_docs:
+                    st.warning("No transcript content in the selected time window.")
+                    analysis_docs = st.session_state.docs
+                
+                # Rank transcript chunks with the vectors already stored in the vector store
+                vectorstore = st.session_state.get("vectorstore")
+                
                 # Feature buttons in a 2x2 grid
                 col1, col2 = st.columns(2)
                 
                 with col1:
                     if st.button("📝 Summarize Video", use_container_width=True):
                         with st.spinner("Generating summary..."):
-                            summary = generate_summary(st.session_state.docs, video_details, llm_model)
-                            st.session_state.generated_content = {"type": "summary", "content": summary}
+                            summary, st.session_state.token_stats = run_task(
+                                "summary", analysis_docs, video_details, llm_model, token_budget, vectorstore
+                            )
+                            st.session_state.generated_content = [{"type": "summary", "content": summary}]
                     
                     if st.button("💡 Key Points", use_container_width=True):
                         with st.spinner("Extracting key points..."):
-                            key_points = extract_key_points(st.session_state.docs, video_details, llm_model)
-                            st.session_state.generated_content = {"type": "key_points", "content": key_points}
+                            key_points, st.session_state.token_stats = run_task(
+                                "key_points", analysis_docs, video_details, llm_model, token_budget, vectorstore
+                            )
+                            st.session_state.generated_content = [{"type": "key_points", "content": key_points}]
                 
                 with col2:
                     if st.button("🔤 Notable Quotes", use_container_width=True):
                         with st.spinner("Finding notable quotes..."):
-                            quotes = extract_notable_quotes(st.session_state.docs, video_details, llm_model)
-                            st.session_state.generated_content = {"type": "quotes", "content": quotes}
+                            quotes, st.session_state.token_stats = run_task(
+                                "quotes", analysis_docs, video_details, llm_model, token_budget, vectorstore
+                            )
+                            st.session_state.generated_content = [{"type": "quotes", "content": quotes}]
                     
                     if st.button("🧠 Study Flashcards", use_container_width=True):
                         with st.spinner("Creating flashcards..."):
-                            flashcards = generate_flashcards(st.session_state.docs, video_details, llm_model)
-                            st.session_state.generated_content = {"type": "flashcards", "content": flashcards}
+                            flashcards, st.session_state.token_stats = run_task(
+                                "flashcards", analysis_docs, video_details, llm_model, token_budget, vectorstore
+                            )
+                            st.session_state.generated_content = [{"type": "flashcards", "content": flashcards}]
                 
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("🗺️ Concept Map", use_container_width=True):
                         with st.spinner("Creating concept map..."):
-                            concept_map = generate_concept_map(st.session_state.docs, video_details, llm_model)
-                            st.session_state.generated_content = {"type": "concept_map", "content": concept_map}
+                            concept_map, st.session_state.token_stats = run_task(
+                                "concept_map", analysis_docs, video_details, llm_model, token_budget, vectorstore
+                            )
+                            st.session_state.generated_content = [{"type": "concept_map", "content": concept_map}]
                 
                 with col2:
                     if st.button("❓ Practice Questions", use_container_width=True):
                         with st.spinner("Creating practice questions..."):
-                            questions = generate_practice_questions(st.session_state.docs, video_details, llm_model)
-                            st.session_state.generated_content = {"type": "questions", "content": questions}
+                            questions, st.session_state.token_stats = run_task(
+                                "questions", analysis_docs, video_details, llm_model, token_budget, vectorstore
+                            )
+                            st.session_state.generated_content = [{"type": "questions", "content": questions}]
+                
+                # Chapter summaries for long videos, one concurrent request per chapter
+                if st.button("📚 Chapter Summaries", use_container_width=True, disabled=not time_index):
+                    with st.spinner("Summarizing chapters..."):
+                        # Copy the stored vectors once for topic detection and every chapter
+                        doc_vectors = get_doc_vectors(vectorstore, time_index.docs)
+                        chapters = get_chapters(video_details, time_index, doc_vectors)
+                        chapter_summaries, st.session_state.token_stats = summarize_chapters(
+                            chapters, time_index, video_details, llm_model, token_budget, vectorstore,
+                            vectors=doc_vectors
+                        )
+                        st.session_state.generated_content = [
+                            {"type": "chapters", "content": format_chapter_summaries(chapter_summaries)}
+                        ]
+                
+                type_titles = {
+                    "summary": "📝 Video Summary",
+                    "key_points": "💡 Key Points",
+                    "quotes": "🔤 Notable Quotes",
+                    "flashcards": "🧠 Study Flashcards",
+                    "concept_map": "🗺️ Concept Map",
+                    "questions": "❓ Practice Questions"
+                }
+                
+                # Generate several artifacts with a single LLM call
+                combined_types = st.multiselect(
+                    "Generate together (batched into few requests, transcript compressed once)",
+                    list(type_titles),
+                    default=["summary", "key_points", "flashcards"],
+                    format_func=lambda content_type: type_titles[content_type]
+                )
+                if st.button("✨ Generate Selected", use_container_width=True, disabled=not combined_types):
+                    with st.spinner("Generating selected content..."):
+                        results, st.session_state.token_stats = run_tasks(
+                            combined_types, analysis_docs, video_details, llm_model, token_budget, vectorstore
+                        )
+                        token_stats = st.session_state.token_stats or {}
+                        if token_stats.get("fallback_tasks"):
+                            reason = " (response was cut off)" if "length" in token_stats.get("finish_reasons", []) else ""
+                            st.warning(
+                                f"The combined response was incomplete{reason}; generated "
+                                f"{', '.join(type_titles[name] for name in token_stats['fallback_tasks'])} separately."
+                            )
+                        st.session_state.generated_content = [
+                            {"type": content_type, "content": content} for content_type, content in results.items()
+                        ]
                 
                 # Display generated content if any
                 if "generated_content" in st.session_state:
                     st.markdown("---")
-                    content_type = st.session_state.generated_content["type"]
-                    content = st.session_state.generated_content["content"]
+                    if st.session_state.get("token_stats"):
+                        token_stats = st.session_state.token_stats
+                        stats_parts = []
+                        if "compressed_tokens" in token_stats:
+                            stats_parts.append(
+                                f"Transcript tokens: {token_stats['compressed_tokens']:,} sent of "
+                                f"{token_stats['original_tokens']:,} ({token_stats['saved_tokens']:,} saved)"
+                            )
+                        if "combined_calls" in token_stats:
+                            stats_parts.append(f"{token_stats['combined_calls']} combined request(s)")
+                        if "elapsed_seconds" in token_stats:
+                            stats_parts.append(f"generated in {token_stats['elapsed_seconds']:.1f}s")
+                        st.caption(" · ".join(stats_parts))
                     
-                    type_titles = {
-                        "summary": "📝 Video Summary",
-                        "key_points": "💡 Key Points",
-                        "quotes": "🔤 Notable Quotes",
-                        "flashcards": "🧠 Study Flashcards",
-                        "concept_map": "🗺️ Concept Map",
-                        "questions": "❓ Practice Questions"
-                    }
-                    
-                    st.subheader(type_titles.get(content_type, "Generated Content"))
-                    st.markdown(content)
-                    
-                    # Download button for the generated content
-                    st.download_button(
-                        label=f"Download {type_titles.get(content_type, 'Content')}",
-                        data=content,
-                        file_name=f"{video_id}_{content_type}.md",
-                        mime="text/markdown"
-                    )
+                    content_titles = dict(type_titles, chapters="📚 Chapter Summaries")
+                    for generated in st.session_state.generated_content:
+                        content_type = generated["type"]
+                        content = generated["content"]
+                        
+                        st.subheader(content_titles.get(content_type, "Generated Content"))
+                        st.markdown(content)
+                        
+                        # Download button for the generated content
+                        st.download_button(
+                            label=f"Download {content_titles.get(content_type, 'Content')}",
+                            data=content,
+                            file_name=f"{video_id}_{content_type}.md",
+                            mime="text/markdown",
+                            key=f"download_{content_type}"
+                        )
             else:
                 if not os.environ.get("OPENAI_API_KEY"):
                     st.warning("Please add your OpenAI API key in the sidebar to enable content generation features.")
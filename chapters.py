@@ -0,0 +1,104 @@
+import re
+
+import numpy as np
+
+CHAPTER_LINE_PATTERN = re.compile(
+    r"^\s*[\(\[]?(?P<time>(?:\d{1,2}:)?\d{1,2}:\d{2})[\)\]]?\s*[-–—:|.]?\s*(?P<title>.+?)\s*$"
+)
+
+def parse_timestamp(value):
+    """Convert an H:MM:SS or M:SS timestamp to seconds."""
+    seconds = 0
+    for part in value.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def parse_description_chapters(description, video_length=None):
+    """
+    Parse chapter timestamps from a video description.
+
+    Follows YouTube's own rules: the first chapter starts at 0:00, there are
+    at least three chapters and their start times increase.
+
+    Returns:
+        List of {'title', 'start', 'end'} dicts, or an empty list
+    """
+    chapters = []
+    for line in (description or "").splitlines():
+        match = CHAPTER_LINE_PATTERN.match(line)
+        if not match:
+            continue
+        start = parse_timestamp(match.group("time"))
+        if chapters and start <= chapters[-1]["start"]:
+            continue
+        chapters.append({"title": match.group("title"), "start": start})
+
+    if len(chapters) < 3 or chapters[0]["start"] != 0:
+        return []
+
+    for chapter, next_chapter in zip(chapters, chapters[1:]):
+        chapter["end"] = next_chapter["start"]
+    chapters[-1]["end"] = video_length if video_length else float("inf")
+    return chapters
+
+def detect_topic_chapters(time_index, vectors, window_seconds=60, min_chapter_seconds=180):
+    """
+    Split the transcript into chapters at topic boundaries.
+
+    The transcript is grouped into fixed windows, each window vector is the
+    mean of its documents' stored vectors (`vectors` has one row per document
+    in `time_index.docs`), and boundaries are placed where similarity between
+    neighbouring windows drops well below average, keeping chapters at least
+    `min_chapter_seconds` long.
+
+    Returns:
+        List of {'title', 'start', 'end'} dicts
+    """
+    end_time = time_index.end_time
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+    rows = {id(doc): row for row, doc in enumerate(time_index.docs)}
+
+    windows = []
+    for start in np.arange(0, end_time, window_seconds):
+        docs = time_index.between(start, start + window_seconds)
+        if docs:
+            windows.append((float(start), vectors[[rows[id(doc)] for doc in docs]].mean(axis=0)))
+    if len(windows) < 2:
+        return [{"title": "Part 1", "start": 0, "end": end_time}]
+
+    window_vectors = np.stack([vector for _, vector in windows])
+    window_vectors /= np.linalg.norm(window_vectors, axis=1, keepdims=True) + 1e-12
+    similarities = np.sum(window_vectors[:-1] * window_vectors[1:], axis=1)
+    threshold = similarities.mean() - 0.5 * similarities.std()
+
+    # Take the sharpest topic shifts first, skipping any that would make a chapter too short
+    boundaries = []
+    for position in np.argsort(similarities):
+        if similarities[position] >= threshold:
+            break
+        boundary = windows[position + 1][0]
+        if boundary < min_chapter_seconds or end_time - boundary < min_chapter_seconds:
+            continue
+        if all(abs(boundary - existing) >= min_chapter_seconds for existing in boundaries):
+            boundaries.append(boundary)
+
+    starts = [0] + sorted(boundaries)
+    ends = starts[1:] + [end_time]
+    return [
+        {"title": f"Part {number}", "start": start, "end": end}
+        for number, (start, end) in enumerate(zip(starts, ends), start=1)
+    ]
+
+def get_chapters(video_details, time_index, vectors=None):
+    """Return description chapters, falling back to detected topic chapters."""
+    video_length = None
+    if video_details and "error" not in video_details:
+        chapters = parse_description_chapters(video_details.get("description"), video_details.get("length"))
+        if chapters:
+            return chapters
+        video_length = video_details.get("length")
+
+    if vectors is None:
+        return [{"title": "Full video", "start": 0, "end": video_length or time_index.end_time}]
+    return detect_topic_chapters(time_index, vectors)
@@ -0,0 +1,15 @@
+from collections import OrderedDict
+
+import pytest
+
+import fingerprint_utils
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Give each test an empty near-duplicate registry."""
+    monkeypatch.setattr(fingerprint_utils, "_videos", OrderedDict())
+    monkeypatch.setattr(fingerprint_utils, "_sizes", {})
+    monkeypatch.setattr(fingerprint_utils, "_transcript_index", fingerprint_utils.MinHashLSH())
+    monkeypatch.setattr(
+        fingerprint_utils, "_audio_index", fingerprint_utils.MinHashLSH(bands=fingerprint_utils.NUM_PERMUTATIONS)
+    )
@@ -1,162 +1,66 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_utils import get_llm
+from langchain_utils import get_doc_vectors, get_llm
+from token_utils import compress_transcript
 
-def generate_summary(docs, video_details=None, llm_model="gpt-3.5-turbo"):
-    """Generate a concise summary of the video content"""
-    llm = get_llm(llm_model)
-    if not llm:
-        return "Please add your OpenAI API key to generate a summary."
-    
-    summary_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert at summarizing YouTube video content.
+# Task registry: each task holds its instructions and a prompt template compiled once at import
+TASKS = {
+    "summary": {
+        "system": """You are an expert at summarizing YouTube video content.
         Create a concise summary of the main points and topics covered in the video.
         If video metadata is provided, incorporate that context.
         Keep the summary clear, informative, and well-structured.
-        Aim for 3-5 paragraphs that capture the essence of the content."""),
-        ("human", """Video details: {video_details}
-        
-        Please summarize the following transcript content:
-        {text}"""),
-    ])
-    
-    # Combine all document content
-    full_text = "\n".join([doc.page_content for doc in docs])
-    
-    # Prepare video details string
-    video_details_text = "Not available"
-    if video_details and "error" not in video_details:
-        video_details_text = f"Title: {video_details['title']}\nAuthor: {video_details['author']}"
-    
-    # Generate summary
-    result = llm.invoke(summary_prompt.format(
-        text=full_text,
-        video_details=video_details_text
-    ))
-    
-    return result.content
-
-def extract_key_points(docs, video_details=None, llm_model="gpt-3.5-turbo"):
-    """Extract key points from the video content"""
-    llm = get_llm(llm_model)
-    if not llm:
-        return "Please add your OpenAI API key to extract key points."
-    
-    key_points_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert at analyzing YouTube video content.
+        Aim for 3-5 paragraphs that capture the essence of the content.""",
+        "request": "Please summarize the following transcript content:",
+        "missing_key": "Please add your OpenAI API key to generate a summary.",
+    },
+    "key_points": {
+        "system": """You are an expert at analyzing YouTube video content.
         Extract the most important key points and insights from the transcript.
         Present these as a bulleted list of 5-10 clear, concise points.
         Focus on the main arguments, conclusions, and takeaways.
-        If possible, include approximate timestamps for when key points were mentioned."""),
-        ("human", """Video details: {video_details}
-        
-        Please extract the key points from the following transcript content:
-        {text}"""),
-    ])
-    
-    # Combine all document content
-    full_text = "\n".join([doc.page_content for doc in docs])
-    
-    # Prepare video details string
-    video_details_text = "Not available"
-    if video_details and "error" not in video_details:
-        video_details_text = f"Title: {video_details['title']}\nAuthor: {video_details['author']}"
-    
-    # Generate key points
-    result = llm.invoke(key_points_prompt.format(
-        text=full_text,
-        video_details=video_details_text
-    ))
-    
-    return result.content
-
-def extract_notable_quotes(docs, video_details=None, llm_model="gpt-3.5-turbo"):
-    """Extract notable quotes from the video content"""
-    llm = get_llm(llm_model)
-    if not llm:
-        return "Please add your OpenAI API key to extract notable quotes."
-    
-    quotes_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert at analyzing YouTube video content.
+        If possible, include approximate timestamps for when key points were mentioned.""",
+        "request": "Please extract the key points from the following transcript content:",
+        "missing_key": "Please add your OpenAI API key to extract key points.",
+    },
+    "quotes": {
+        "system": """You are an expert at analyzing YouTube video content.
         Extract 5-8 notable, insightful or important quotes from the transcript.
         For each quote:
         1. Include the exact quote in quotation marks
         2. Add a brief explanation of why this quote is significant
         3. Include the approximate timestamp if available
-        
-        Focus on quotes that capture key insights, memorable statements, or powerful moments."""),
-        ("human", """Video details: {video_details}
-        
-        Please extract notable quotes from the following transcript content:
-        {text}"""),
-    ])
-    
-    # Combine all document content
-    full_text = "\n".join([doc.page_content for doc in docs])
-    
-    # Prepare video details string
-    video_details_text = "Not available"
-    if video_details and "error" not in video_details:
-        video_details_text = f"Title: {video_details['title']}\nAuthor: {video_details['author']}"
-    
-    # Generate quotes
-    result = llm.invoke(quotes_prompt.format(
-        text=full_text,
-        video_details=video_details_text
-    ))
-    
-    return result.content
 
-def generate_flashcards(docs, video_details=None, llm_model="gpt-3.5-turbo"):
-    """Generate study flashcards from the video content"""
-    llm = get_llm(llm_model)
-    if not llm:
-        return "Please add your OpenAI API key to generate flashcards."
-    
-    flashcards_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert at creating educational content.
+        Focus on quotes that capture key insights, memorable statements, or powerful moments.""",
+        "request": "Please extract notable quotes from the following transcript content:",
+        "missing_key": "Please add your OpenAI API key to extract notable quotes.",
+    },
+    "flashcards": {
+        "system": """You are an expert at creating educational content.
         Create 5-10 high-quality study flashcards based on the video transcript.
         Each flashcard should have:
         1. A clear, concise question that tests understanding of an important concept
         2. A comprehensive yet concise answer that provides the necessary information
-        
+
         Format as:
         Q: [Question]
         A: [Answer]
-        
-        Focus on key concepts, definitions, and important facts that would be valuable for learning."""),
-        ("human", """Video details: {video_details}
-        
-        Please create study flashcards from the following transcript content:
-        {text}"""),
-    ])
-    
-    # Combine all document content
-    full_text = "\n".join([doc.page_content for doc in docs])
-    
-    # Prepare video details string
-    video_details_text = "Not available"
-    if video_details and "error" not in video_details:
-        video_details_text = f"Title: {video_details['title']}\nAuthor: {video_details['author']}"
-    
-    # Generate flashcards
-    result = llm.invoke(flashcards_prompt.format(
-        text=full_text,
-        video_details=video_details_text
-    ))
-    
-    return result.content
 
-def generate_concept_map(docs, video_details=None, llm_model="gpt-3.5-turbo"):
-    """Generate a text-based concept map of the video content"""
-    llm = get_llm(llm_model)
-    if not llm:
-        return "Please add your OpenAI API key to generate a concept map."
-    
-    concept_map_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert at knowledge organization and conceptual mapping.
+        Focus on key concepts, definitions, and important facts that would be valuable for learning.""",
+        "request": "Please create study flashcards from the following transcript content:",
+        "missing_key": "Please add your OpenAI API key to generate flashcards.",
+    },
+    "concept_map": {
+        "system": """You are an expert at knowledge organization and conceptual mapping.
         Create a text-based concept map that shows the relationships between key concepts in the video.
         Structure your response as:
-        
+
         1. Main topic/concept
            ├── Subtopic/concept 1
            │   ├── Related idea 1.1
@@ -164,64 +68,324 @@ def generate_concept_map(docs, video_details=None, llm_model="gpt-3.5-turbo"):
            └── Subtopic/concept 2
                ├── Related idea 2.1
                └── Related idea 2.2
-        
-        Focus on showing connections and hierarchies between concepts.
-        Include 5-10 main concepts with their related ideas and connections."""),
-        ("human", """Video details: {video_details}
-        
-        Please create a concept map from the following transcript content:
-        {text}"""),
-    ])
-    
-    # Combine all document content
-    full_text = "\n".join([doc.page_content for doc in docs])
-    
-    # Prepare video details string
-    video_details_text = "Not available"
-    if video_details and "error" not in video_details:
-        video_details_text = f"Title: {video_details['title']}\nAuthor: {video_details['author']}"
-    
-    # Generate concept map
-    result = llm.invoke(concept_map_prompt.format(
-        text=full_text,
-        video_details=video_details_text
-    ))
-    
-    return result.content
 
-def generate_practice_questions(docs, video_details=None, llm_model="gpt-3.5-turbo"):
-    llm = get_llm(llm_model)
-    if not llm:
-        return "Please add your OpenAI API key to generate practice questions."
-    
-    questions_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert educator.
+        Focus on showing connections and hierarchies between concepts.
+        Include 5-10 main concepts with their related ideas and connections.""",
+        "request": "Please create a concept map from the following transcript content:",
+        "missing_key": "Please add your OpenAI API key to generate a concept map.",
+    },
+    "questions": {
+        "system": """You are an expert educator.
         Create 5 high-quality practice questions based on the video transcript.
         For each question:
         1. Write a clear, specific question that tests understanding of an important concept
         2. Provide 4 multiple-choice options (labeled A, B, C, D)
         3. Indicate the correct answer
         4. Include a brief explanation of why that answer is correct
-        
-        Create questions that test different levels of understanding, from recall to application and analysis."""),
+
+        Create questions that test different levels of understanding, from recall to application and analysis.""",
+        "request": "Please create practice questions from the following transcript content:",
+        "missing_key": "Please add your OpenAI API key to generate practice questions.",
+    },
+    "chapter_summary": {
+        "system": """You are an expert at summarizing YouTube video content.
+        Summarize a single chapter of the video in 1-2 short paragraphs.
+        Focus on what this chapter covers and how it fits the video as a whole.""",
+        "request": "Please summarize the following chapter transcript content:",
+        "missing_key": "Please add your OpenAI API key to generate chapter summaries.",
+    },
+}
+
+def _build_prompt(task):
+    """Compile the chat prompt template for a task"""
+    return ChatPromptTemplate.from_messages([
+        ("system", task["system"]),
         ("human", """Video details: {video_details}
-        
-        Please create practice questions from the following transcript content:
+
+        """ + task["request"] + """
         {text}"""),
     ])
-    
-    # Combine all document content
-    full_text = "\n".join([doc.page_content for doc in docs])
-    
-    # Prepare video details string
-    video_details_text = "Not available"
+
+for _task in TASKS.values():
+    _task["prompt"] = _build_prompt(_task)
+
+def format_video_details(video_details=None):
+    """Format video metadata for the prompt"""
     if video_details and "error" not in video_details:
-        video_details_text = f"Title: {video_details['title']}\nAuthor: {video_details['author']}"
-    
-    # Generate practice questions
-    result = llm.invoke(questions_prompt.format(
+        return f"Title: {video_details['title']}\nAuthor: {video_details['author']}"
+    return "Not available"
+
+def prepare_transcript(docs, llm_model="gpt-3.5-turbo", token_budget=None, vectorstore=None):
+    """Compress the transcript to fit the token budget, ranking chunks with the stored vectors"""
+    return compress_transcript(
+        docs,
+        model_name=llm_model,
+        token_budget=token_budget,
+        vectors=get_doc_vectors(vectorstore, docs)
+    )
+
+def run_task(task_name, docs, video_details=None, llm_model="gpt-3.5-turbo", token_budget=None, vectorstore=None):
+    """
+    Run a registered generation task; every task goes through this single path.
+
+    Returns:
+        Generated content and a dict of token statistics (None if nothing was sent)
+    """
+    task = TASKS[task_name]
+    llm = get_llm(llm_model)
+    if not llm:
+        return task["missing_key"], None
+
+    full_text, token_stats = prepare_transcript(docs, llm_model, token_budget, vectorstore)
+
+    started = time.perf_counter()
+    result = llm.invoke(task["prompt"].format_messages(
+        text=full_text,
+        video_details=format_video_details(video_details)
+    ))
+    token_stats["elapsed_seconds"] = time.perf_counter() - started
+
+    return result.content, token_stats
+
+# Cap the combined response below the smallest supported output limit, and ask for
+# few enough artifacts per call (about 1000 tokens each) that a response fits
+COMBINED_MAX_TOKENS = 3000
+MAX_TASKS_PER_CALL = 3
+
+COMBINED_SYSTEM = """You are an expert at analyzing YouTube video content and creating educational material.
+        Produce several artifacts from the same transcript in a single response.
+        Respond with one JSON object that has exactly these keys: {keys}.
+        The value for each key must be a Markdown string following the instructions for that key.
+
+        """
+
+@lru_cache(maxsize=None)
+def _build_combined_prompt(task_names):
+    """Compile one prompt that asks for several tasks as JSON fields"""
+    instructions = "\n\n".join(
+        f"Instructions for \"{name}\":\n        {TASKS[name]['system']}" for name in task_names
+    )
+    return ChatPromptTemplate.from_messages([
+        ("system", COMBINED_SYSTEM.format(keys=", ".join(f'"{name}"' for name in task_names))
+            + instructions.replace("{", "{{").replace("}", "}}")),
+        ("human", """Video details: {video_details}
+
+        Please create the requested artifacts from the following transcript content:
+        {text}"""),
+    ])
+
+def _as_markdown(value):
+    """Coerce a JSON field into Markdown text"""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(item if isinstance(item, str) else json.dumps(item) for item in value)
+    return json.dumps(value, indent=2)
+
+def _parse_json_fields(content):
+    """
+    Parse a JSON object field by field, keeping the fields completed before any cut-off.
+
+    Returns:
+        Dict of the fields that parsed (empty if none did)
+    """
+    try:
+        parsed = json.loads(content)
+        return parsed if isinstance(parsed, dict) else {}
+    except json.JSONDecodeError:
+        pass
+
+    decoder = json.JSONDecoder()
+    fields = {}
+    position = content.find("{") + 1
+    if position == 0:
+        return fields
+    try:
+        while True:
+            while content[position] in " \t\r\n,":
+                position += 1
+            if content[position] == "}":
+                return fields
+            key, position = decoder.raw_decode(content, position)
+            while content[position] in " \t\r\n:":
+                position += 1
+            value, position = decoder.raw_decode(content, position)
+            fields[key] = value
+    except (json.JSONDecodeError, IndexError):
+        return fields
+
+def _run_combined(task_names, llm, full_text, video_details):
+    """Request several tasks in one JSON response; returns the parsed fields and the response"""
+    result = llm.bind(
+        response_format={"type": "json_object"},
+        max_tokens=COMBINED_MAX_TOKENS
+    ).invoke(
+        _build_combined_prompt(task_names).format_messages(
+            text=full_text,
+            video_details=format_video_details(video_details)
+        )
+    )
+    return _parse_json_fields(result.content), result
+
+def run_tasks(task_names, docs, video_details=None, llm_model="gpt-3.5-turbo", token_budget=None, vectorstore=None):
+    """
+    Run several registered tasks with as few LLM calls as possible.
+
+    The transcript is compressed once and tasks are requested in batches of
+    MAX_TASKS_PER_CALL, each returning a JSON object with one field per task.
+    Fields completed before a cut-off are kept; tasks still missing are run
+    separately and listed under 'fallback_tasks' in the statistics.
+
+    Returns:
+        Dict mapping each task name to its generated content, and a dict of token statistics
+    """
+    task_names = tuple(task_names)
+    if len(task_names) == 1:
+        content, token_stats = run_task(task_names[0], docs, video_details, llm_model, token_budget, vectorstore)
+        return {task_names[0]: content}, token_stats
+
+    llm = get_llm(llm_model)
+    if not llm:
+        return {name: TASKS[name]["missing_key"] for name in task_names}, None
+
+    full_text, token_stats = prepare_transcript(docs, llm_model, token_budget, vectorstore)
+
+    batches = [task_names[i:i + MAX_TASKS_PER_CALL] for i in range(0, len(task_names), MAX_TASKS_PER_CALL)]
+    # Fold a lone trailing task into the previous batch rather than spending a call on it
+    if len(batches) > 1 and len(batches[-1]) == 1:
+        batches[-2] += batches.pop()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+        responses = list(executor.map(lambda batch: _run_combined(batch, llm, full_text, video_details), batches))
+    token_stats["elapsed_seconds"] = time.perf_counter() - started
+    token_stats["combined_calls"] = len(batches)
+
+    artifacts = {}
+    finish_reasons = []
+    for fields, result in responses:
+        artifacts.update(fields)
+        finish_reasons.append(result.response_metadata.get("finish_reason"))
+
+    results = {}
+    fallback_tasks = []
+    for name in task_names:
+        if artifacts.get(name):
+            results[name] = _as_markdown(artifacts[name])
+            continue
+        # Generate anything missing from the combined responses on its own
+        content, task_stats = run_task(name, docs, video_details, llm_model, token_budget, vectorstore)
+        results[name] = content
+        fallback_tasks.append(name)
+        if task_stats:
+            token_stats["elapsed_seconds"] += task_stats["elapsed_seconds"]
+
+    if fallback_tasks:
+        token_stats["fallback_tasks"] = fallback_tasks
+        token_stats["finish_reasons"] = finish_reasons
+    return results, token_stats
+
+def generate_summary(docs, video_details=None, llm_model="gpt-3.5-turbo", token_budget=None, vectorstore=None):
+    """Generate a concise summary of the video content"""
+    return run_task("summary", docs, video_details, llm_model, token_budget, vectorstore)[0]
+
+def extract_key_points(docs, video_details=None, llm_model="gpt-3.5-turbo", token_budget=None, vectorstore=None):
+    """Extract key points from the video content"""
+    return run_task("key_points", docs, video_details, llm_model, token_budget, vectorstore)[0]
+
+def extract_notable_quotes(docs, video_details=None, llm_model="gpt-3.5-turbo", token_budget=None, vectorstore=None):
+    """Extract notable quotes from the video content"""
+    return run_task("quotes", docs, video_details, llm_model, token_budget, vectorstore)[0]
+
+def generate_flashcards(docs, video_details=None, llm_model="gpt-3.5-turbo", token_budget=None, vectorstore=None):
+    """Generate study flashcards from the video content"""
+    return run_task("flashcards", docs, video_details, llm_model, token_budget, vectorstore)[0]
+
+def generate_concept_map(docs, video_details=None, llm_model="gpt-3.5-turbo", token_budget=None, vectorstore=None):
+    """Generate a text-based concept map of the video content"""
+    return run_task("concept_map", docs, video_details, llm_model, token_budget, vectorstore)[0]
+
+def generate_practice_questions(docs, video_details=None, llm_model="gpt-3.5-turbo", token_budget=None, vectorstore=None):
+    """Generate multiple-choice practice questions from the video content"""
+    return run_task("questions", docs, video_details, llm_model, token_budget, vectorstore)[0]
+
+# Chapter summaries keyed by a hash of their inputs, so only changed chapters are regenerated.
+# Shared by all sessions in the process, so it is capped as an LRU.
+MAX_CACHED_CHAPTER_SUMMARIES = 256
+_chapter_cache = OrderedDict()
+_chapter_cache_lock = threading.Lock()
+
+def _summarize_chapter(llm, chapter, docs, video_details_text, llm_model, token_budget, vectors):
+    """Summarize one chapter, reusing a cached summary when its inputs are unchanged"""
+    chapter_text = "\n".join(doc.page_content for doc in docs)
+    cache_key = hashlib.sha256("\x00".join([
+        llm_model, str(token_budget), video_details_text, chapter["title"], chapter_text
+    ]).encode("utf-8")).hexdigest()
+
+    with _chapter_cache_lock:
+        if cache_key in _chapter_cache:
+            _chapter_cache.move_to_end(cache_key)
+            return _chapter_cache[cache_key]
+
+    full_text, _ = compress_transcript(docs, model_name=llm_model, token_budget=token_budget, vectors=vectors)
+    result = llm.invoke(TASKS["chapter_summary"]["prompt"].format_messages(
         text=full_text,
-        video_details=video_details_text
+        video_details=f"{video_details_text}\nChapter: {chapter['title']}"
     ))
-    
-    return result.content
\ No newline at end of file
+
+    with _chapter_cache_lock:
+        _chapter_cache[cache_key] = result.content
+        while len(_chapter_cache) > MAX_CACHED_CHAPTER_SUMMARIES:
+            _chapter_cache.popitem(last=False)
+    return result.content
+
+def summarize_chapters(chapters, time_index, video_details=None, llm_model="gpt-3.5-turbo",
+                       token_budget=None, vectorstore=None, max_workers=4, vectors=None):
+    """
+    Summarize each chapter concurrently.
+
+    `vectors` holds one stored vector per document in `time_index.docs`; when
+    not given it is copied from the vector store once, and each chapter takes
+    its rows from that copy.
+
+    Returns:
+        List of chapter dicts with an added 'summary' field, and a dict of timing statistics
+    """
+    llm = get_llm(llm_model)
+    if not llm:
+        return [dict(chapter, summary=TASKS["chapter_summary"]["missing_key"]) for chapter in chapters], None
+
+    video_details_text = format_video_details(video_details)
+    chapter_docs = [time_index.between(chapter["start"], chapter["end"]) for chapter in chapters]
+    # Look up stored vectors up front so the worker threads never re-embed
+    if vectors is None:
+        vectors = get_doc_vectors(vectorstore, time_index.docs)
+    if vectors is None:
+        chapter_vectors = [None] * len(chapters)
+    else:
+        rows = {id(doc): row for row, doc in enumerate(time_index.docs)}
+        chapter_vectors = [vectors[[rows[id(doc)] for doc in docs]] for docs in chapter_docs]
+
+    def summarize(chapter, docs, vectors):
+        if not docs:
+            return "No transcript content in this chapter."
+        # One failing chapter (e.g. a rate limit) must not discard the others; failures are not cached
+        try:
+            return _summarize_chapter(llm, chapter, docs, video_details_text, llm_model, token_budget, vectors)
+        except Exception as e:
+            return f"Could not summarize this chapter: {str(e)}"
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        summaries = list(executor.map(summarize, chapters, chapter_docs, chapter_vectors))
+    token_stats = {"elapsed_seconds": time.perf_counter() - started}
+
+    return [dict(chapter, summary=summary) for chapter, summary in zip(chapters, summaries)], token_stats
+
+def format_chapter_summaries(chapter_summaries):
+    """Render chapter summaries as Markdown with timestamped headings"""
+    sections = []
+    for chapter in chapter_summaries:
+        timestamp = time.strftime("%H:%M:%S", time.gmtime(chapter["start"]))
+        sections.append(f"### [{timestamp}] {chapter['title']}\n\n{chapter['summary']}")
+    return "\n\n".join(sections)
@@ -0,0 +1,316 @@
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 32
+MINHASH_PRIME = 4294967311  # Smallest prime above 2**32
+TRANSCRIPT_MATCH_THRESHOLD = 0.8
+VECTOR_REUSE_THRESHOLD = 0.9
+VECTOR_REUSE_MAX_OFFSET_SECONDS = 1.0
+AUDIO_CANDIDATE_THRESHOLD = 1 / NUM_PERMUTATIONS  # At least one matching band
+AUDIO_MAX_BIT_ERROR_RATE = 0.35
+AUDIO_HOP_SECONDS = 512 / 16000
+MAX_REGISTERED_VIDEOS = 100
+MAX_REGISTRY_BYTES = 256 * 1024 * 1024
+DOC_OVERHEAD_BYTES = 400  # Rough per-document cost of Document objects and metadata dicts
+COVERAGE_TOLERANCE_SECONDS = 30
+
+_rng = np.random.default_rng(1)
+_PERMUTATION_A = _rng.integers(1, 2**31, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERMUTATION_B = _rng.integers(0, 2**31, NUM_PERMUTATIONS, dtype=np.uint64)
+
+def minhash_signature(tokens):
+    """Compute a MinHash signature for a collection of string tokens."""
+    hashes = np.array(sorted({zlib.crc32(token.encode("utf-8")) for token in tokens}), dtype=np.uint64)
+    if len(hashes) == 0:
+        return np.full(NUM_PERMUTATIONS, MINHASH_PRIME, dtype=np.uint64)
+    permuted = (np.outer(hashes, _PERMUTATION_A) + _PERMUTATION_B) % MINHASH_PRIME
+    return permuted.min(axis=0)
+
+def estimate_similarity(signature, other):
+    """Estimate Jaccard similarity from two MinHash signatures."""
+    return float(np.mean(signature == other))
+
+def transcript_shingles(text, size=5):
+    """Return the set of word shingles in a transcript."""
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+def estimate_time_offset(segments, other_segments, min_matches=3):
+    """
+    Estimate how many seconds later the same speech occurs in `other_segments`.
+
+    Segments whose normalized text appears exactly once in both transcripts
+    vote with their start time difference and the median wins.
+
+    Returns:
+        Offset in seconds, or None when too few segments match
+    """
+    def unique_starts(transcript_segments):
+        starts = {}
+        for text, start in zip(transcript_segments.texts(), transcript_segments.starts.tolist()):
+            key = " ".join(re.findall(r"[a-z0-9']+", text.lower()))
+            if key:
+                starts.setdefault(key, []).append(start)
+        return {key: values[0] for key, values in starts.items() if len(values) == 1}
+
+    own, other = unique_starts(segments), unique_starts(other_segments)
+    differences = [other[key] - start for key, start in own.items() if key in other]
+    if len(differences) < min_matches:
+        return None
+    return float(np.median(differences))
+
+def shares_timeline(transcript_segments, entry):
+    """
+    Check that a registered video's transcript lines up in time with these segments.
+
+    Artifacts keyed by time, such as documents, vectors and the time index, can
+    only be reused when the speech occurs at the same times and ends together.
+    """
+    stored = entry.get("transcript_segments")
+    if stored is None or not len(stored) or not len(transcript_segments):
+        return False
+    offset = estimate_time_offset(transcript_segments, stored)
+    return (
+        offset is not None
+        and abs(offset) <= VECTOR_REUSE_MAX_OFFSET_SECONDS
+        and abs(stored.ends.max() - transcript_segments.ends.max()) <= COVERAGE_TOLERANCE_SECONDS
+    )
+
+def audio_shingles(codes, size=3):
+    """Return the set of runs of `size` consecutive fingerprint codes."""
+    codes = codes.tolist()
+    return {" ".join(map(str, codes[i:i + size])) for i in range(len(codes) - size + 1)}
+
+def audio_fingerprint(audio, sample_rate=16000, frame_length=2048, hop_length=512,
+                      bands=13, smoothing=8, lag=4, batch_size=512):
+    """
+    Compute a Haitsma-Kalker style audio fingerprint.
+
+    Each frame yields a 12-bit code from the signs of log-energy differences
+    between neighbouring frequency bands, compared `lag` frames apart. Band
+    energies are smoothed over time so codes survive re-encoding, volume
+    changes and clips that start partway through a frame.
+
+    Returns:
+        Array of per-frame codes
+    """
+    frame_count = 1 + (len(audio) - frame_length) // hop_length
+    if frame_count < smoothing + lag + 1:
+        return np.array([], dtype=np.int64)
+
+    # Log-spaced bands over the range where speech and music energy concentrates
+    frequencies = np.fft.rfftfreq(frame_length, 1 / sample_rate)
+    edges = np.geomspace(300, 3000, bands + 1)
+    band_masks = [(frequencies >= low) & (frequencies < high) for low, high in zip(edges, edges[1:])]
+    window = np.hanning(frame_length).astype(np.float32)
+
+    # Process frames in batches to bound memory on long inputs
+    band_energy = []
+    for first in range(0, frame_count, batch_size):
+        frames = np.arange(first, min(first + batch_size, frame_count))
+        indices = np.arange(frame_length)[None, :] + hop_length * frames[:, None]
+        spectrum = np.abs(np.fft.rfft(audio[indices] * window, axis=1)) ** 2
+        band_energy.append(np.stack([spectrum[:, mask].sum(axis=1) for mask in band_masks], axis=1))
+    band_energy = np.log(np.concatenate(band_energy) + 1e-10)
+
+    kernel = np.ones(smoothing) / smoothing
+    band_energy = np.stack([
+        np.convolve(band_energy[:, band], kernel, mode="valid") for band in range(bands)
+    ], axis=1)
+
+    band_difference = band_energy[:, :-1] - band_energy[:, 1:]
+    bits = (band_difference[lag:] - band_difference[:-lag]) > 0
+    return bits.astype(np.int64) @ (1 << np.arange(bits.shape[1], dtype=np.int64))
+
+def estimate_offset(codes, other_codes):
+    """
+    Estimate how many frames into `other_codes` the audio of `codes` starts.
+
+    Exact code matches vote for a frame offset and the most common offset wins.
+    """
+    positions = {}
+    for position, code in enumerate(other_codes.tolist()):
+        positions.setdefault(code, []).append(position)
+
+    votes = {}
+    for position, code in enumerate(codes.tolist()):
+        for other_position in positions.get(code, [])[:10]:
+            offset = other_position - position
+            votes[offset] = votes.get(offset, 0) + 1
+    return max(votes, key=votes.get) if votes else 0
+
+def bit_error_rate(codes, other_codes, offset, bits=12):
+    """Fraction of differing bits between two fingerprints aligned at a frame offset."""
+    positions = np.arange(len(codes))
+    aligned = (positions + offset >= 0) & (positions + offset < len(other_codes))
+    if not aligned.any():
+        return 1.0
+    differences = np.bitwise_xor(codes[positions[aligned]], other_codes[positions[aligned] + offset])
+    return float(np.bitwise_count(differences).mean() / bits)
+
+class MinHashLSH:
+    """Locality-sensitive hash index over MinHash signatures using banding."""
+
+    def __init__(self, bands=LSH_BANDS):
+        self.bands = bands
+        self.rows = NUM_PERMUTATIONS // bands
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def insert(self, key, signature):
+        """Add a signature to the index, replacing any previous one for the key."""
+        self.remove(key)
+        self._signatures[key] = signature
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, set()).add(key)
+
+    def remove(self, key):
+        """Remove a key from the index if present."""
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            bucket.get(band_key, set()).discard(key)
+
+    def query(self, signature, threshold, exclude=None):
+        """Return indexed keys at or above the similarity threshold as (key, similarity), best first."""
+        candidates = set()
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates |= bucket.get(band_key, set())
+        candidates.discard(exclude)
+
+        matches = [(key, estimate_similarity(signature, self._signatures[key])) for key in candidates]
+        return sorted(
+            [(key, similarity) for key, similarity in matches if similarity >= threshold],
+            key=lambda match: match[1],
+            reverse=True
+        )
+
+# Registry of processed videos, shared across sessions in this server process and
+# capped by entry count and approximate memory, evicting the least recently used
+_videos = OrderedDict()
+_transcript_index = MinHashLSH()
+# Audio is indexed by runs of three codes. Unrelated clips share about 0.1% of
+# them, while copies with a bit error rate up to about 0.1 still share 3-5%, so
+# any single-row band collision makes a candidate: that keeps copies with about
+# 98% probability and prunes about 88% of unrelated videos before the aligned
+# bit error rate check
+_audio_index = MinHashLSH(bands=NUM_PERMUTATIONS)
+_sizes = {}
+_registry_lock = threading.Lock()
+
+def _entry_size(entry):
+    """Approximate memory held by a registry entry in bytes."""
+    size = len(entry.get("transcript_text", ""))
+    if "transcript_segments" in entry:
+        size += entry["transcript_segments"].nbytes
+    if "audio_codes" in entry:
+        size += entry["audio_codes"].nbytes
+    docs = entry.get("docs") or []
+    # Documents are held twice, by the entry and by the vector store's docstore
+    size += 2 * sum(len(doc.page_content) + DOC_OVERHEAD_BYTES for doc in docs)
+    if entry.get("vectorstore") is not None:
+        index = entry["vectorstore"].index
+        size += index.ntotal * index.d * 4
+    if entry.get("time_index") is not None:
+        size += 5 * 8 * len(entry["time_index"])
+    return size
+
+def _touch(video_id):
+    """Mark a video as recently used and return its entry."""
+    entry = _videos.setdefault(video_id, {})
+    _videos.move_to_end(video_id)
+    return entry
+
+def _update_size(video_id):
+    """Re-measure an updated entry and evict the oldest entries beyond the count or memory limit."""
+    _sizes[video_id] = _entry_size(_videos[video_id])
+    total = sum(_sizes.values())
+    while _videos and (len(_videos) > MAX_REGISTERED_VIDEOS or total > MAX_REGISTRY_BYTES):
+        evicted, _ = _videos.popitem(last=False)
+        total -= _sizes.pop(evicted, 0)
+        _transcript_index.remove(evicted)
+        _audio_index.remove(evicted)
+
+def register_transcript(video_id, transcript_text, transcript_segments, **processed):
+    """Record a processed transcript and any derived artifacts (docs, vectorstore, ...)."""
+    signature = minhash_signature(transcript_shingles(transcript_text))
+    with _registry_lock:
+        entry = _touch(video_id)
+        entry.update(processed, transcript_text=transcript_text, transcript_segments=transcript_segments)
+        _transcript_index.insert(video_id, signature)
+        _update_size(video_id)
+
+def find_transcript_match(transcript_text, exclude=None):
+    """
+    Find a processed video whose transcript nearly matches this one.
+
+    Returns:
+        (video_id, similarity, entry) or None
+    """
+    if not transcript_text or not transcript_text.strip():
+        return None
+    signature = minhash_signature(transcript_shingles(transcript_text))
+    with _registry_lock:
+        matches = _transcript_index.query(signature, TRANSCRIPT_MATCH_THRESHOLD, exclude)
+        if not matches:
+            return None
+        video_id, similarity = matches[0]
+        return video_id, similarity, dict(_videos[video_id])
+
+def register_audio(video_id, codes, duration):
+    """Record the audio fingerprint of a video's opening minutes and its full duration."""
+    if len(codes) < 3:
+        return
+    signature = minhash_signature(audio_shingles(codes))
+    with _registry_lock:
+        _touch(video_id).update(audio_codes=codes, audio_duration=duration)
+        _audio_index.insert(video_id, signature)
+        _update_size(video_id)
+
+def record_whisper_model(video_id, model_size):
+    """Record which Whisper model produced a video's transcript."""
+    with _registry_lock:
+        _touch(video_id)["whisper_model"] = model_size
+        _update_size(video_id)
+
+def find_audio_match(codes, exclude=None, accept=None):
+    """
+    Find a processed video with matching opening audio and a stored transcript.
+
+    `accept`, if given, is called with each candidate entry and filters out
+    transcripts that may not be reused (for example from a smaller model).
+
+    Returns:
+        (video_id, similarity, offset_seconds, entry) or None
+    """
+    if len(codes) < 3:
+        return None
+    signature = minhash_signature(audio_shingles(codes))
+    with _registry_lock:
+        candidates = [
+            (video_id, dict(_videos[video_id]))
+            for video_id, _ in _audio_index.query(signature, AUDIO_CANDIDATE_THRESHOLD, exclude)
+            if "transcript_segments" in _videos[video_id]
+            and (accept is None or accept(_videos[video_id]))
+        ]
+
+    best = None
+    for video_id, entry in candidates:
+        offset = estimate_offset(codes, entry["audio_codes"])
+        error_rate = bit_error_rate(codes, entry["audio_codes"], offset)
+        if error_rate <= AUDIO_MAX_BIT_ERROR_RATE and (best is None or error_rate < best[1]):
+            best = (video_id, error_rate, offset, entry)
+    if best is None:
+        return None
+
+    video_id, error_rate, offset, entry = best
+    return video_id, 1 - error_rate, offset * AUDIO_HOP_SECONDS, entry
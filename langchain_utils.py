@@ -1,4 +1,7 @@
+import hashlib
 import os
+import faiss
+import numpy as np
 import streamlit as st
 
 from langchain_core.documents import Document
@@ -7,8 +10,10 @@ from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
+from time_index import TimeIndex
+
 def process_with_langchain(transcript_text, transcript_segments=None, embed_model="huggingface"):
-    """Process the transcript with LangChain."""
+    """Process the transcript with LangChain and index the resulting documents by time."""
     # Create text splitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=500,
@@ -20,12 +25,16 @@ def process_with_langchain(transcript_text, transcript_segments=None, embed_mode
     if transcript_segments and len(transcript_segments) > 0:
         # Create documents from transcript segments with timestamps
         docs = []
-        for segment in transcript_segments:
+        for text, start, duration in zip(
+            transcript_segments.texts(),
+            transcript_segments.starts.tolist(),
+            transcript_segments.durations.tolist()
+        ):
             doc = Document(
-                page_content=segment['text'],
+                page_content=text,
                 metadata={
-                    "start": segment['start'],
-                    "duration": segment['duration']
+                    "start": start,
+                    "duration": duration
                 }
             )
             docs.append(doc)
@@ -33,11 +42,15 @@ def process_with_langchain(transcript_text, transcript_segments=None, embed_mode
         # Split the full transcript
         docs = text_splitter.create_documents([transcript_text])
     
+    # Record each document's row in the vector index so its embedding can be looked up later
+    for position, doc in enumerate(docs):
+        doc.metadata["position"] = position
+    
     # Initialize embeddings model
     if embed_model == "openai":
         if not os.environ.get("OPENAI_API_KEY"):
             st.error("Please set your OpenAI API key in the sidebar to use this embedding model.")
-            return None, None
+            return None, None, None
         embeddings = OpenAIEmbeddings()
     else:  # default to huggingface
         embeddings = HuggingFaceEmbeddings(
@@ -48,18 +61,66 @@ def process_with_langchain(transcript_text, transcript_segments=None, embed_mode
     # Create vector store
     try:
         vectorstore = FAISS.from_documents(docs, embeddings)
-        return docs, vectorstore
+        return docs, vectorstore, TimeIndex(docs)
     except Exception as e:
         st.error(f"Error creating vector store: {str(e)}")
-        return None, None
+        return None, None, None
 
-def get_llm(model_name="gpt-3.5-turbo"):
-    """Initialize and return LLM based on settings"""
-    if not os.environ.get("OPENAI_API_KEY"):
-        st.error("Please set your OpenAI API key in the sidebar to use the content generation features.")
+def get_doc_vectors(vectorstore, docs):
+    """
+    Return the stored embedding of each document, one row per document, without re-embedding.
+    
+    Only the rows for `docs` are copied out of the index.
+    """
+    if vectorstore is None or not docs or any("position" not in doc.metadata for doc in docs):
         return None
+    positions = np.array([doc.metadata["position"] for doc in docs], dtype=np.int64)
+    return vectorstore.index.reconstruct_batch(positions)
+
+def search_transcript(vectorstore, query, k=4, time_range=None, time_index=None):
+    """
+    Retrieve the transcript documents most similar to the query, optionally within a time window.
+    
+    With a time window, the documents in range are looked up in the time index
+    and the FAISS search is restricted to their rows, so vectors outside the
+    window are never scored.
+    """
+    if time_range is None or time_index is None:
+        return vectorstore.similarity_search(query, k=k)
     
+    window_docs = {doc.metadata["position"]: doc for doc in time_index.between(*time_range) if "position" in doc.metadata}
+    if not window_docs:
+        return []
+    
+    query_vector = np.array([vectorstore._embed_query(query)], dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(query_vector)
+    selector = faiss.IDSelectorBatch(np.fromiter(window_docs, dtype=np.int64))
+    _, rows = vectorstore.index.search(
+        query_vector,
+        min(k, len(window_docs)),
+        params=faiss.SearchParameters(sel=selector)
+    )
+    return [window_docs[row] for row in rows[0].tolist() if row in window_docs]
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _create_llm(model_name, api_key_hash, _api_key):
+    """
+    Create one LLM client per model and API key; its HTTP connection pool is reused across calls.
+    
+    The cache is keyed by a hash of the key (underscore arguments are not hashed by Streamlit).
+    """
     return ChatOpenAI(
         temperature=0.2,
-        model=model_name
-    )
\ No newline at end of file
+        model=model_name,
+        api_key=_api_key
+    )
+
+def get_llm(model_name="gpt-3.5-turbo"):
+    """Return the shared LLM client for the given model"""
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        st.error("Please set your OpenAI API key in the sidebar to use the content generation features.")
+        return None
+    
+    return _create_llm(model_name, hashlib.sha256(api_key.encode("utf-8")).hexdigest(), api_key)
\ No newline at end of file
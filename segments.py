@@ -0,0 +1,120 @@
+import csv
+import io
+from functools import cached_property
+
+import numpy as np
+
+class TranscriptSegments:
+    """
+    Columnar container for timed transcript segments.
+
+    Start times and durations are stored as float arrays and all segment text
+    lives in one string buffer addressed by offsets. Slicing returns a view that
+    shares the arrays and the text buffer instead of copying them.
+    """
+
+    def __init__(self, starts, durations, text_buffer, offsets):
+        self.starts = starts
+        self.durations = durations
+        self._text_buffer = text_buffer
+        self._offsets = offsets
+
+    @classmethod
+    def from_dicts(cls, segments):
+        """Build from a list of {'text', 'start', 'duration'} dicts."""
+        segments = sorted(segments, key=lambda segment: segment.get('start', 0))
+        texts = [segment.get('text', '') for segment in segments]
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=offsets[1:])
+        return cls(
+            np.array([segment.get('start', 0) for segment in segments], dtype=np.float64),
+            np.array([segment.get('duration', 0) for segment in segments], dtype=np.float64),
+            "".join(texts),
+            offsets
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("TranscriptSegments only supports contiguous slices")
+            stop = max(start, stop)
+            return TranscriptSegments(
+                self.starts[start:stop],
+                self.durations[start:stop],
+                self._text_buffer,
+                self._offsets[start:stop + 1]
+            )
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return {
+            'text': self.text(index),
+            'start': float(self.starts[index]),
+            'duration': float(self.durations[index])
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the arrays and the text buffer."""
+        return self.starts.nbytes + self.durations.nbytes + self._offsets.nbytes + len(self._text_buffer)
+
+    @property
+    def ends(self):
+        """End time of each segment in seconds."""
+        return self.starts + self.durations
+
+    def text(self, index):
+        """Return the text of a single segment."""
+        return self._text_buffer[self._offsets[index]:self._offsets[index + 1]]
+
+    def texts(self):
+        """Return the text of every segment as a list."""
+        offsets = self._offsets.tolist()
+        return [self._text_buffer[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def full_text(self, separator=" "):
+        """Join all segment text into a single string."""
+        return separator.join(self.texts())
+
+    def slice_time(self, start_time, end_time):
+        """Return a view of the segments that start within [start_time, end_time)."""
+        first = int(np.searchsorted(self.starts, start_time, side="left"))
+        last = int(np.searchsorted(self.starts, end_time, side="left"))
+        return self[first:last]
+
+    def shift(self, seconds):
+        """Return segments moved by `seconds`, sharing the text buffer."""
+        return TranscriptSegments(self.starts + seconds, self.durations, self._text_buffer, self._offsets)
+
+    @cached_property
+    def timestamps(self):
+        """Start times formatted as HH:MM:SS strings."""
+        if not len(self):
+            return np.array([], dtype=str)
+        seconds = self.starts.astype(np.int64)
+        hours = np.char.zfill((seconds // 3600).astype(str), 2)
+        minutes = np.char.zfill((seconds // 60 % 60).astype(str), 2)
+        secs = np.char.zfill((seconds % 60).astype(str), 2)
+        return np.char.add(np.char.add(np.char.add(hours, ":"), np.char.add(minutes, ":")), secs)
+
+    def to_table(self):
+        """Return Timestamp and Text columns for display."""
+        return {"Timestamp": self.timestamps, "Text": self.texts()}
+
+    @cached_property
+    def csv_bytes(self):
+        """Timestamp and Text columns encoded as UTF-8 CSV."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(["Timestamp", "Text"])
+        writer.writerows(zip(self.timestamps.tolist(), self.texts()))
+        return buffer.getvalue().encode('utf-8')
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+import fingerprint_utils
+from fingerprint_utils import (
+    AUDIO_CANDIDATE_THRESHOLD, AUDIO_MAX_BIT_ERROR_RATE, audio_fingerprint, audio_shingles,
+    bit_error_rate, estimate_offset, find_audio_match, minhash_signature, register_audio, register_transcript
+)
+from segments import TranscriptSegments
+
+SAMPLE_RATE = 16000
+
+def _speech_like(seconds, seed):
+    """Tones with random on/off envelopes over noise, standing in for speech or music."""
+    rng = np.random.default_rng(seed)
+    times = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    audio = 0.3 * rng.standard_normal(len(times))
+    for _ in range(6):
+        envelope = np.repeat(rng.random(seconds * 10), SAMPLE_RATE // 10) ** 2
+        audio += envelope * np.sin(2 * np.pi * rng.uniform(200, 3000) * times + rng.uniform(0, 2 * np.pi))
+    return audio.astype(np.float32)
+
+def _jaccard(codes, other_codes):
+    shingles, other_shingles = audio_shingles(codes), audio_shingles(other_codes)
+    return len(shingles & other_shingles) / len(shingles | other_shingles)
+
+@pytest.fixture(scope="module")
+def recordings():
+    original = _speech_like(201, seed=1)
+    noise = 0.05 * np.random.default_rng(9).standard_normal(180 * SAMPLE_RATE).astype(np.float32)
+    return {
+        "original": audio_fingerprint(original[:180 * SAMPLE_RATE]),
+        # Starts 20 s (plus a fraction of a frame) into the original, with added noise
+        "offset_copy": audio_fingerprint(original[20 * SAMPLE_RATE + 123:200 * SAMPLE_RATE + 123] + noise),
+        # Same start, lower volume and added noise
+        "reencoded": audio_fingerprint(original[:180 * SAMPLE_RATE] * 0.5 + noise),
+        "unrelated": audio_fingerprint(_speech_like(180, seed=2)[:180 * SAMPLE_RATE]),
+    }
+
+def _register(video_id, codes):
+    segments = TranscriptSegments.from_dicts([
+        {"text": f"line {i}", "start": i * 5.0, "duration": 5.0} for i in range(60)
+    ])
+    register_audio(video_id, codes, 300.0)
+    register_transcript(video_id, segments.full_text(), segments)
+
+def test_code_triples_separate_copies_from_unrelated_audio(recordings):
+    original = recordings["original"]
+    assert _jaccard(original, recordings["unrelated"]) < 0.005
+    assert _jaccard(original, recordings["offset_copy"]) > 0.02
+    assert _jaccard(original, recordings["reencoded"]) > 0.02
+
+def test_audio_index_prunes_unrelated_videos(registry, recordings):
+    for seed in range(10, 30):
+        register_audio(f"unrelated-{seed}", audio_fingerprint(_speech_like(60, seed)), 60.0)
+    register_audio("original", recordings["original"], 180.0)
+
+    signature = minhash_signature(audio_shingles(recordings["offset_copy"]))
+    candidates = [video_id for video_id, _ in fingerprint_utils._audio_index.query(signature, AUDIO_CANDIDATE_THRESHOLD)]
+    assert "original" in candidates
+    assert len(candidates) <= 6
+
+def test_offset_and_bit_error_rate(recordings):
+    original, copy = recordings["original"], recordings["offset_copy"]
+    offset = estimate_offset(copy, original)
+    assert offset * fingerprint_utils.AUDIO_HOP_SECONDS == pytest.approx(20.0, abs=0.1)
+    assert bit_error_rate(copy, original, offset) < AUDIO_MAX_BIT_ERROR_RATE / 2
+
+    unrelated = recordings["unrelated"]
+    assert bit_error_rate(unrelated, original, estimate_offset(unrelated, original)) > AUDIO_MAX_BIT_ERROR_RATE
+
+def test_find_audio_match_aligns_offset_copy(registry, recordings):
+    _register("original", recordings["original"])
+    match = find_audio_match(recordings["offset_copy"])
+    assert match is not None
+    video_id, similarity, offset_seconds, entry = match
+    assert video_id == "original"
+    assert similarity >= 1 - AUDIO_MAX_BIT_ERROR_RATE
+    assert offset_seconds == pytest.approx(20.0, abs=0.1)
+
+    video_id, _, offset_seconds, _ = find_audio_match(recordings["reencoded"])
+    assert video_id == "original"
+    assert offset_seconds == pytest.approx(0.0, abs=0.1)
+
+def test_find_audio_match_ignores_unrelated_audio(registry, recordings):
+    _register("original", recordings["original"])
+    assert find_audio_match(recordings["unrelated"]) is None
+    assert find_audio_match(recordings["original"], exclude="original") is None
+    assert find_audio_match(recordings["offset_copy"], accept=lambda entry: False) is None
+
+def test_registry_is_capped_by_memory(registry, recordings, monkeypatch):
+    _register("first", recordings["original"])
+    entry_size = fingerprint_utils._sizes["first"]
+    monkeypatch.setattr(fingerprint_utils, "MAX_REGISTRY_BYTES", int(entry_size * 1.5))
+    _register("second", recordings["unrelated"])
+    assert list(fingerprint_utils._videos) == ["second"]
+    assert find_audio_match(recordings["offset_copy"]) is None
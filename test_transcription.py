@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import transcription
+from fingerprint_utils import COVERAGE_TOLERANCE_SECONDS, record_whisper_model, register_audio, register_transcript
+from segments import TranscriptSegments
+from transcription import SPAN_GAP_SECONDS, detect_speech_spans, find_duplicate_transcript, map_to_original_time
+
+SAMPLE_RATE = 16000
+
+def _tone(seconds, amplitude=0.3, frequency=220):
+    times = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * times)).astype(np.float32)
+
+def _noise(seconds, amplitude=1e-4, seed=0):
+    return (amplitude * np.random.default_rng(seed).standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+
+def test_sparse_speech_is_isolated():
+    audio = np.concatenate([_noise(60, seed=1), _tone(4), _noise(60, seed=2)])
+    spans = detect_speech_spans(audio, SAMPLE_RATE)
+    assert len(spans) == 1
+    start, end = spans[0][0] / SAMPLE_RATE, spans[0][1] / SAMPLE_RATE
+    assert 59.5 <= start <= 60.0
+    assert 64.0 <= end <= 64.5
+
+def test_continuous_speech_is_kept():
+    audio = _tone(30) * (1 + 0.5 * np.sin(np.linspace(0, 40, 30 * SAMPLE_RATE))).astype(np.float32)
+    spans = detect_speech_spans(audio, SAMPLE_RATE)
+    kept = sum(end - start for start, end in spans) if spans else len(audio)
+    assert kept >= 0.95 * len(audio)
+
+def test_silence_has_no_speech():
+    assert detect_speech_spans(_noise(30), SAMPLE_RATE) == []
+
+def test_map_to_original_time_accounts_for_gaps():
+    spans = [(10 * SAMPLE_RATE, 12 * SAMPLE_RATE), (30 * SAMPLE_RATE, 35 * SAMPLE_RATE)]
+    times = [0.0, 1.5, 2.0 + SPAN_GAP_SECONDS / 2, 2.0 + SPAN_GAP_SECONDS + 1.0]
+    mapped = map_to_original_time(times, spans, SAMPLE_RATE)
+    np.testing.assert_allclose(mapped, [10.0, 11.5, 12.0, 31.0])
+
+@pytest.fixture
+def stored_video(registry):
+    """A registered 300 s video transcribed with Whisper 'small', one segment every 5 s."""
+    rng = np.random.default_rng(3)
+    audio = np.concatenate([
+        _tone(0.5, amplitude=rng.uniform(0.05, 0.5), frequency=rng.uniform(200, 3000)) for _ in range(600)
+    ]) + _noise(300, amplitude=0.01)
+    segments = TranscriptSegments.from_dicts([
+        {"text": f"line {i}", "start": i * 5.0, "duration": 5.0} for i in range(60)
+    ])
+    register_audio("stored", transcription.audio_fingerprint(audio[:180 * SAMPLE_RATE]), 300.0)
+    register_transcript("stored", segments.full_text(), segments, transcript_source="whisper")
+    record_whisper_model("stored", "small")
+    return audio
+
+def _use_audio(monkeypatch, audio, duration):
+    monkeypatch.setattr(transcription, "load_audio_head", lambda file_path: audio[:180 * SAMPLE_RATE])
+    monkeypatch.setattr(transcription, "get_audio_duration", lambda file_path: duration)
+
+def test_duplicate_transcript_is_aligned_when_covered(stored_video, monkeypatch):
+    _use_audio(monkeypatch, stored_video[20 * SAMPLE_RATE:], 250.0)
+    text, segments = find_duplicate_transcript("copy", "copy.wav", "base")
+    assert segments is not None
+    assert segments.starts[0] == pytest.approx(0.0, abs=0.1)
+    assert segments.ends.max() == pytest.approx(250.0, abs=0.1)
+
+def test_duplicate_transcript_needs_coverage(stored_video, monkeypatch):
+    # Runs past the end of the stored video by more than the tolerance
+    _use_audio(monkeypatch, stored_video[20 * SAMPLE_RATE:], 280.0 + COVERAGE_TOLERANCE_SECONDS + 1)
+    assert find_duplicate_transcript("longer", "longer.wav", "base") == (None, None)
+
+def test_duplicate_transcript_needs_equal_or_larger_model(stored_video, monkeypatch):
+    _use_audio(monkeypatch, stored_video, 300.0)
+    assert find_duplicate_transcript("large", "large.wav", "large") == (None, None)
+    assert find_duplicate_transcript("small", "small.wav", "small")[1] is not None
@@ -0,0 +1,67 @@
+import numpy as np
+
+# Documents longer than this multiple of the median duration are kept apart from the rest
+LONG_DURATION_FACTOR = 4
+
+class TimeIndex:
+    """
+    Interval index over timed transcript documents.
+
+    Documents are sorted by start time. Ordinary documents are found by binary
+    search on their start times, reaching back by the longest ordinary
+    duration; unusually long documents (more than LONG_DURATION_FACTOR times
+    the median duration, e.g. a Whisper segment spanning a long pause) are
+    kept in a separate list and checked directly, so one of them cannot widen
+    every later query. Lookups cost O(log n + m + L), where m is the number of
+    ordinary documents starting within one maximum ordinary duration of the
+    window and L is the number of long documents.
+    """
+
+    def __init__(self, docs):
+        timed = [doc for doc in docs if "start" in doc.metadata]
+        starts = np.array([doc.metadata["start"] for doc in timed], dtype=np.float64)
+        ends = starts + np.array([doc.metadata.get("duration", 0) for doc in timed], dtype=np.float64)
+
+        order = np.argsort(starts, kind="stable")
+        self.docs = [timed[i] for i in order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+
+        durations = self.ends - self.starts
+        is_long = durations > LONG_DURATION_FACTOR * np.median(durations) if len(durations) else durations > 0
+        self._long = np.flatnonzero(is_long)
+        self._short = np.flatnonzero(~is_long)
+        self._short_starts = self.starts[self._short]
+        self._short_reach = float(durations[self._short].max()) if len(self._short) else 0.0
+
+    def __len__(self):
+        return len(self.docs)
+
+    @property
+    def end_time(self):
+        """End time of the last document in seconds."""
+        return float(self.ends.max()) if len(self) else 0.0
+
+    def _candidates(self, start_time, end_time):
+        """Return positions of documents whose intervals may overlap [start_time, end_time]."""
+        first = int(np.searchsorted(self._short_starts, start_time - self._short_reach, side="left"))
+        last = int(np.searchsorted(self._short_starts, end_time, side="right"))
+        return np.concatenate([self._short[first:last], self._long])
+
+    def between(self, start_time, end_time):
+        """Return documents that overlap the window [start_time, end_time), in time order."""
+        positions = self._candidates(start_time, end_time)
+        mask = (self.ends[positions] > start_time) & (self.starts[positions] < end_time)
+        return [self.docs[position] for position in np.sort(positions[mask]).tolist()]
+
+    def at(self, timestamp):
+        """Return documents being spoken at the given time."""
+        positions = self._candidates(timestamp, timestamp)
+        mask = (self.starts[positions] <= timestamp) & (self.ends[positions] > timestamp)
+        return [self.docs[position] for position in np.sort(positions[mask]).tolist()]
+
+    def surrounding(self, doc, seconds=30):
+        """Return the documents within `seconds` either side of a retrieved document."""
+        start = doc.metadata.get("start", 0)
+        end = start + doc.metadata.get("duration", 0)
+        return self.between(start - seconds, end + seconds)
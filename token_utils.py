@@ -0,0 +1,188 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+import tiktoken
+
+# Default transcript budgets leave room for the system prompt, video details and the response
+MODEL_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 12000,
+    "gpt-4o-mini": 100000,
+}
+DEFAULT_TOKEN_BUDGET = 12000
+
+DISFLUENCY_PATTERN = re.compile(
+    r"\[(?:music|applause|laughter|inaudible|silence)\]"  # Caption sound tags
+    r"|\b(?:um+|uh+|uhm+|erm+|hmm+|mhm|ah+)\b[,.]?",      # Filler words
+    re.IGNORECASE
+)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name="gpt-3.5-turbo"):
+    """Return the tiktoken encoding used by the given model."""
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+def count_tokens(text, model_name="gpt-3.5-turbo"):
+    """Count tokens in text with the model's tokenizer."""
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
+
+def get_token_budget(model_name="gpt-3.5-turbo"):
+    """Return the default transcript token budget for a model."""
+    return MODEL_TOKEN_BUDGETS.get(model_name, DEFAULT_TOKEN_BUDGET)
+
+def strip_disfluencies(text):
+    """Remove filler words and caption sound tags from text."""
+    text = DISFLUENCY_PATTERN.sub(" ", text)
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+def _dedupe_indexed(fragments, window=3):
+    """Dedupe fragments, returning (original index, fragment) pairs for the ones kept."""
+    deduped = []
+    recent = []
+    for index, fragment in enumerate(fragments):
+        normalized = fragment.lower()
+        if not normalized or normalized in recent:
+            continue
+
+        if deduped:
+            previous_words = deduped[-1][1].split()
+            words = fragment.split()
+            overlap = 0
+            for size in range(min(len(previous_words), len(words)), 1, -1):
+                if [w.lower() for w in previous_words[-size:]] == [w.lower() for w in words[:size]]:
+                    overlap = size
+                    break
+            fragment = " ".join(words[overlap:])
+            if not fragment:
+                continue
+
+        deduped.append((index, fragment))
+        recent.append(normalized)
+        if len(recent) > window:
+            recent.pop(0)
+    return deduped
+
+def dedupe_fragments(fragments, window=3):
+    """
+    Drop repeated caption fragments.
+
+    Auto-generated captions often repeat a line verbatim or roll the tail of the
+    previous line into the next one. Exact repeats within the last `window`
+    fragments are dropped and rolled-over words (two or more) are trimmed.
+    """
+    return [fragment for _, fragment in _dedupe_indexed(fragments, window)]
+
+def truncate_tokens(text, max_tokens, model_name="gpt-3.5-turbo"):
+    """Cut text down to at most max_tokens tokens."""
+    encoding = get_encoding(model_name)
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+def _group_chunks(fragments, model_name, chunk_tokens):
+    """
+    Group consecutive (index, fragment) pairs into chunks of roughly chunk_tokens tokens.
+
+    Returns:
+        List of (text, tokens, fragment indices) tuples
+    """
+    chunks = []
+    current, current_indices, current_tokens = [], [], 0
+    for index, fragment in fragments:
+        tokens = count_tokens(fragment, model_name)
+        if current and current_tokens + tokens > chunk_tokens:
+            chunks.append((" ".join(current), current_tokens, current_indices))
+            current, current_indices, current_tokens = [], [], 0
+        current.append(fragment)
+        current_indices.append(index)
+        current_tokens += tokens
+    if current:
+        chunks.append((" ".join(current), current_tokens, current_indices))
+    return chunks
+
+def _centrality_scores(chunks, vectors):
+    """
+    Score each chunk by cosine similarity to the mean embedding.
+
+    Chunk vectors are the mean of their documents' stored vectors, so nothing
+    is re-embedded.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+    chunk_vectors = np.stack([vectors[indices].mean(axis=0) for _, _, indices in chunks])
+    chunk_vectors /= np.linalg.norm(chunk_vectors, axis=1, keepdims=True) + 1e-12
+    centroid = chunk_vectors.mean(axis=0)
+    centroid /= np.linalg.norm(centroid) + 1e-12
+    return chunk_vectors @ centroid
+
+def select_chunks(chunks, token_budget, model_name="gpt-3.5-turbo", vectors=None):
+    """
+    Select chunks that fit the token budget, keeping their original order.
+
+    With document vectors (one row per document), the most central chunks
+    (closest to the mean embedding) are kept. Without them, chunks are sampled
+    evenly across the transcript. If not even the top chunk fits, it is
+    truncated to the budget.
+    """
+    if not chunks or token_budget <= 0:
+        return []
+    if vectors is not None:
+        ranking = np.argsort(-_centrality_scores(chunks, vectors)).tolist()
+    else:
+        keep_ratio = token_budget / max(sum(tokens for _, tokens, _ in chunks), 1)
+        step = max(int(round(1 / keep_ratio)), 1)
+        ranking = list(range(0, len(chunks), step)) + [
+            i for i in range(len(chunks)) if i % step
+        ]
+
+    selected = []
+    used_tokens = 0
+    for index in ranking:
+        tokens = chunks[index][1]
+        if used_tokens + tokens <= token_budget:
+            selected.append(index)
+            used_tokens += tokens
+
+    if not selected:
+        return [truncate_tokens(chunks[ranking[0]][0], token_budget, model_name)]
+    return [chunks[index][0] for index in sorted(selected)]
+
+def compress_transcript(docs, model_name="gpt-3.5-turbo", token_budget=None,
+                        vectors=None, chunk_tokens=200):
+    """
+    Build prompt-ready transcript text that fits the token budget.
+
+    Repeated caption fragments and disfluencies are removed first. If the text
+    is still over budget, the most informative chunks are selected using the
+    documents' stored vectors when given (one row per document).
+
+    Returns:
+        Transcript text and a dict of token statistics
+    """
+    if token_budget is None:
+        token_budget = get_token_budget(model_name)
+
+    fragments = [doc.page_content for doc in docs]
+    original_tokens = count_tokens("\n".join(fragments), model_name)
+
+    cleaned = _dedupe_indexed([strip_disfluencies(fragment) for fragment in fragments])
+    text = "\n".join(fragment for _, fragment in cleaned)
+    compressed_tokens = count_tokens(text, model_name)
+
+    selected = False
+    if compressed_tokens > token_budget:
+        chunks = _group_chunks(cleaned, model_name, chunk_tokens)
+        text = "\n".join(select_chunks(chunks, token_budget, model_name, vectors))
+        compressed_tokens = count_tokens(text, model_name)
+        selected = True
+
+    stats = {
+        "original_tokens": original_tokens,
+        "compressed_tokens": compressed_tokens,
+        "saved_tokens": original_tokens - compressed_tokens,
+        "token_budget": token_budget,
+        "selected_chunks": selected,
+    }
+    return text, stats
@@ -1,8 +1,16 @@
 import os
+import subprocess
+import time
+import numpy as np
 import streamlit as st
 import whisper
 import yt_dlp
 
+from fingerprint_utils import (
+    COVERAGE_TOLERANCE_SECONDS, audio_fingerprint, find_audio_match, record_whisper_model, register_audio
+)
+from segments import TranscriptSegments
+
 def download_youtube_audio(video_id, output_directory="downloads"):
     """
     Download YouTube video audio using yt-dlp.
@@ -39,13 +47,93 @@ def download_youtube_audio(video_id, output_directory="downloads"):
         st.error(f"Download error: {str(e)}")
         return None
 
-def transcribe_audio(file_path, model_size="base"):
+# Silence inserted between speech spans so Whisper does not merge words across cuts
+SPAN_GAP_SECONDS = 0.5
+
+def detect_speech_spans(audio, sample_rate=whisper.audio.SAMPLE_RATE, frame_ms=30,
+                        min_silence_seconds=1.0, padding_seconds=0.25, threshold_db=12):
+    """
+    Find speech regions in PCM audio with an energy-based voice activity detector.
+    
+    The noise floor is the 10th percentile of frame loudness and the speech
+    level is the median of frames well above it, so sparse speech in mostly
+    silent audio is still found. A frame counts as speech when it is
+    `threshold_db` above the floor, or halfway to the speech level when the two
+    are closer. Pauses shorter than `min_silence_seconds` are kept so sentences
+    stay intact, and each span is padded to avoid clipping word onsets.
+    
+    Returns:
+        List of (start_sample, end_sample) tuples, empty when no frame stands
+        out from the noise floor and the audio should be transcribed whole
+    """
+    frame_length = int(sample_rate * frame_ms / 1000)
+    frame_count = len(audio) // frame_length
+    if frame_count == 0:
+        return [(0, len(audio))]
+    
+    frames = audio[:frame_count * frame_length].reshape(frame_count, frame_length)
+    loudness = 20 * np.log10(np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-10)
+    noise_floor = np.percentile(loudness, 10)
+    loud = loudness[loudness > noise_floor + threshold_db]
+    if len(loud) == 0:
+        return []
+    speech_level = np.median(loud)
+    threshold = noise_floor + min(threshold_db, (speech_level - noise_floor) / 2)
+    is_speech = loudness > threshold
+    
+    spans = []
+    min_silence_frames = int(min_silence_seconds * 1000 / frame_ms)
+    speech_frames = np.flatnonzero(is_speech)
+    if len(speech_frames) == 0:
+        return []
+    
+    # Merge speech frames separated by short pauses
+    gaps = np.flatnonzero(np.diff(speech_frames) > min_silence_frames)
+    span_starts = np.concatenate([[speech_frames[0]], speech_frames[gaps + 1]])
+    span_ends = np.concatenate([speech_frames[gaps], [speech_frames[-1]]]) + 1
+    
+    padding = int(padding_seconds * sample_rate)
+    for start, end in zip(span_starts * frame_length, span_ends * frame_length):
+        start, end = max(int(start) - padding, 0), min(int(end) + padding, len(audio))
+        if spans and start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+    return spans
+
+def join_speech_spans(audio, spans, sample_rate=whisper.audio.SAMPLE_RATE, gap_seconds=SPAN_GAP_SECONDS):
+    """Concatenate speech spans with a short silence between them."""
+    gap = np.zeros(int(gap_seconds * sample_rate), dtype=audio.dtype)
+    pieces = []
+    for index, (start, end) in enumerate(spans):
+        if index:
+            pieces.append(gap)
+        pieces.append(audio[start:end])
+    return np.concatenate(pieces)
+
+def map_to_original_time(times, spans, sample_rate=whisper.audio.SAMPLE_RATE, gap_seconds=SPAN_GAP_SECONDS):
+    """
+    Map times in the joined speech audio back to times in the original audio.
+    
+    Times that fall in the silence between two spans map to the end of the
+    earlier span.
+    """
+    lengths = np.array([end - start for start, end in spans], dtype=np.float64) / sample_rate
+    speech_starts = np.concatenate([[0.0], np.cumsum(lengths + gap_seconds)[:-1]])
+    original_starts = np.array([start for start, _ in spans], dtype=np.float64) / sample_rate
+    
+    times = np.asarray(times, dtype=np.float64)
+    positions = np.clip(np.searchsorted(speech_starts, times, side="right") - 1, 0, len(spans) - 1)
+    return original_starts[positions] + np.clip(times - speech_starts[positions], 0, lengths[positions])
+
+def transcribe_audio(file_path, model_size="base", skip_silence=True):
     """
     Transcribe audio file using Whisper.
     
     Args:
         file_path: Path to the audio file
         model_size: Whisper model size ('tiny', 'base', 'small', 'medium', 'large')
+        skip_silence: Drop non-speech regions before transcribing
     
     Returns:
         Transcription text and segments
@@ -55,18 +143,124 @@ def transcribe_audio(file_path, model_size="base"):
             model = whisper.load_model(model_size)
             status.update(label="Model loaded successfully")
             
+            audio = whisper.load_audio(file_path)
+            spans = detect_speech_spans(audio) if skip_silence else []
+            if spans:
+                speech = join_speech_spans(audio, spans)
+                skipped = 1 - sum(end - start for start, end in spans) / max(len(audio), 1)
+            else:
+                speech, skipped = audio, 0.0
+            
             status.update(label=f"Transcribing audio with Whisper {model_size}...")
+            started = time.perf_counter()
             # Use device auto-detection to use GPU if available
-            result = model.transcribe(file_path, fp16=False)  # Use FP32 for CPU compatibility
+            result = model.transcribe(speech, fp16=False)  # Use FP32 for CPU compatibility
+            elapsed = time.perf_counter() - started
+            
+            segments = result.get("segments", [])
+            if spans and segments:
+                # Restore original timestamps for segments from the trimmed audio
+                starts = map_to_original_time([segment["start"] for segment in segments], spans)
+                ends = map_to_original_time([segment["end"] for segment in segments], spans)
+                for segment, start, end in zip(segments, starts.tolist(), ends.tolist()):
+                    segment["start"], segment["end"] = start, end
+            
+            if skipped > 0:
+                st.caption(
+                    f"Skipped {skipped:.0%} of the audio as silence: "
+                    f"{len(audio) / len(speech):.1f}x less audio sent to Whisper "
+                    f"({len(speech) / whisper.audio.SAMPLE_RATE:.0f}s of {len(audio) / whisper.audio.SAMPLE_RATE:.0f}s, "
+                    f"transcribed in {elapsed:.0f}s)"
+                )
             status.update(label="Transcription complete!", state="complete")
         
-        return result["text"], result.get("segments", [])
+        return result["text"], segments
     
     except Exception as e:
         st.error(f"Transcription error: {str(e)}")
         return None, []
 
-def download_and_transcribe(video_id, whisper_model_size="base"):
+def load_audio_head(file_path, seconds=180, sample_rate=whisper.audio.SAMPLE_RATE):
+    """Decode only the first `seconds` of an audio file as mono float32 PCM."""
+    command = [
+        "ffmpeg", "-nostdin", "-i", file_path, "-t", str(seconds),
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-"
+    ]
+    output = subprocess.run(command, capture_output=True, check=True).stdout
+    return np.frombuffer(output, np.int16).astype(np.float32) / 32768.0
+
+def get_audio_duration(file_path):
+    """Return the duration of an audio file in seconds."""
+    command = [
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", file_path
+    ]
+    return float(subprocess.run(command, capture_output=True, check=True, text=True).stdout.strip())
+
+# Whisper model sizes from least to most accurate
+WHISPER_MODEL_SIZES = ["tiny", "base", "small", "medium", "large"]
+
+def is_transcript_as_accurate(entry, whisper_model_size):
+    """Check a registered transcript came from captions or a Whisper model at least as large as requested."""
+    if entry.get("transcript_source") == "youtube":
+        return True
+    model = entry.get("whisper_model")
+    if model not in WHISPER_MODEL_SIZES or whisper_model_size not in WHISPER_MODEL_SIZES:
+        return False
+    return WHISPER_MODEL_SIZES.index(model) >= WHISPER_MODEL_SIZES.index(whisper_model_size)
+
+def find_duplicate_transcript(video_id, audio_file, whisper_model_size="base"):
+    """
+    Reuse the transcript of a near-duplicate video with matching opening audio.
+    
+    The audio fingerprint of the first minutes is looked up in the shared LSH
+    index. A match is only reused when its transcript came from captions or a
+    Whisper model at least as large as `whisper_model_size`, and when the
+    stored audio and transcript cover this video's whole length at the
+    estimated offset; the stored segments are then aligned and trimmed to this
+    video's duration.
+    
+    Returns:
+        Transcription text and segments, or (None, None) when there is no usable match
+    """
+    try:
+        codes = audio_fingerprint(load_audio_head(audio_file))
+        duration = get_audio_duration(audio_file)
+        match = find_audio_match(
+            codes, accept=lambda entry: is_transcript_as_accurate(entry, whisper_model_size)
+        )
+        register_audio(video_id, codes, duration)
+        if not match:
+            return None, None
+        
+        matched_id, similarity, offset, entry = match
+        stored = entry["transcript_segments"]
+        end = offset + duration
+        covered = (
+            len(stored) > 0
+            and offset >= -COVERAGE_TOLERANCE_SECONDS
+            and entry.get("audio_duration", 0) + COVERAGE_TOLERANCE_SECONDS >= end
+            and stored.ends.max() + COVERAGE_TOLERANCE_SECONDS >= end
+        )
+        if not covered:
+            return None, None
+        
+        segments = stored.slice_time(offset, end).shift(-offset)
+        if not segments:
+            return None, None
+        
+        # The reused transcript is only as accurate as the model that produced it
+        record_whisper_model(video_id, entry.get("whisper_model", whisper_model_size))
+        st.info(
+            f"Reused the transcript of near-duplicate video {matched_id} "
+            f"({similarity:.0%} audio match, aligned at {offset:.0f}s) instead of running Whisper"
+        )
+        return segments.full_text().strip(), segments
+    except Exception:
+        # Fingerprinting is an optimization; fall back to a full transcription
+        return None, None
+
+def download_and_transcribe(video_id, whisper_model_size="base", skip_silence=True):
     """Download audio and transcribe using Whisper."""
     output_dir = "downloads"
     
@@ -74,23 +268,28 @@ def download_and_transcribe(video_id, whisper_model_size="base"):
         audio_file = download_youtube_audio(video_id, output_dir)
     
     if not audio_file:
-        return "Failed to download audio for transcription.", [], "error"
+        return "Failed to download audio for transcription.", TranscriptSegments.from_dicts([]), "error"
     
-    with st.spinner(f"Transcribing audio using Whisper {whisper_model_size}..."):
-        transcription, segments = transcribe_audio(audio_file, whisper_model_size)
+    with st.spinner("Checking for near-duplicate videos..."):
+        transcription, formatted_segments = find_duplicate_transcript(video_id, audio_file, whisper_model_size)
     
     if not transcription:
-        return "Transcription failed.", [], "error"
-    
-    # Convert Whisper segments to YouTube-like format
-    formatted_segments = []
-    if segments:
-        for segment in segments:
-            formatted_segments.append({
+        with st.spinner(f"Transcribing audio using Whisper {whisper_model_size}..."):
+            transcription, segments = transcribe_audio(audio_file, whisper_model_size, skip_silence)
+        
+        if not transcription:
+            return "Transcription failed.", TranscriptSegments.from_dicts([]), "error"
+        record_whisper_model(video_id, whisper_model_size)
+        
+        # Convert Whisper segments to YouTube-like format
+        formatted_segments = TranscriptSegments.from_dicts([
+            {
                 'text': segment.get('text', ''),
                 'start': segment.get('start', 0),
                 'duration': segment.get('end', 0) - segment.get('start', 0)
-            })
+            }
+            for segment in segments
+        ])
     
     # Clean up downloaded file to save space
     try:
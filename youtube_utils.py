@@ -3,6 +3,7 @@ import pytube
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import NoTranscriptFound
 
+from segments import TranscriptSegments
 from transcription import download_and_transcribe
 
 def extract_video_id(youtube_url):
@@ -34,12 +35,12 @@ def get_video_details(video_id):
     except Exception as e:
         return {"error": f"Error retrieving video details: {str(e)}"}
 
-def get_transcript(video_id, whisper_model_size="base"):
+def get_transcript(video_id, whisper_model_size="base", skip_silence=True):
     """Get transcript using YouTube Transcript API or fall back to Whisper."""
     try:
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-        transcript_text = " ".join([segment['text'] for segment in transcript_list])
-        return transcript_text.strip(), transcript_list, "youtube"
+        transcript_segments = TranscriptSegments.from_dicts(YouTubeTranscriptApi.get_transcript(video_id))
+        transcript_text = transcript_segments.full_text()
+        return transcript_text.strip(), transcript_segments, "youtube"
     except (NoTranscriptFound, Exception) as e:
         # Fall back to Whisper transcription for any error
-        return download_and_transcribe(video_id, whisper_model_size)
\ No newline at end of file
+        return download_and_transcribe(video_id, whisper_model_size, skip_silence)
\ No newline at end of file